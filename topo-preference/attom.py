@@ -1,12 +1,15 @@
 import os 
 import time 
-import requests
+import logging
+import resource
 import pandas as pd 
 from datetime import datetime#, timezone
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine  
-from apscheduler.schedulers.background import BackgroundScheduler
+import clientbackbone as cb
+import db
+
+logger = logging.getLogger(__name__)
 
 # Get enviroment into os.environ 
 load_dotenv()
@@ -19,46 +22,15 @@ HEADERS = {
 }
 
 # Handles API calls to Attom API 
-class AttomClient:
-    def __init__(self):
-        # Hard rate limit
-        self.rate_limit  = 200 # per min
-        self.calls_made  = 0 
-        self.client_time = time.time() 
-        # Intrinsic db information and scheduler
-        self.engine     = create_engine("sqlite:///data//attom_data.db")
-        self.scheduler = BackgroundScheduler(timezone="America/Chicago")
-
-
-    def _throttle(self):
-        current = time.time()
-        elapsed = current - self.client_time
-
-        # Rate and time checks
-        if elapsed >= 60: 
-            self.client_time = time.time() 
-            self.calls_made  = 0 
-        elif self.calls_made >= self.rate_limit: 
-            wait = 60 - elapsed  
-            time.sleep(wait)
-            self.client_time = time.time()
-            self.calls_made  = 0 
-
-        self.calls_made += 1
-    
-    # Main api call 
-    def _get(self, endpoint: str, params: dict) -> dict: 
-
-        self._throttle() # Get calls made and apply rate limit 
-        url  = f"{BASE_URL}{endpoint}"
-        print(f"url: {url}")
-        resp = requests.get(url, headers=HEADERS, params=params, timeout=10)
-        resp.raise_for_status()
-        return resp.json()
-    
+class AttomClient(cb.ParentClient):
+    def __init__(self, base_url: str=BASE_URL, db_path: str=db.ATTOM_DB):
+        # Hard rate limit of 200 per min, pooled keep-alive session from parent
+        super().__init__(db_path, 200)
+        self.base_url = base_url
+
     # AREA API METHODS 
     def fetch_states(self) -> pd.DataFrame:
-        raw = self._get("/areaapi/v2.0.0/state/lookup", {})
+        raw = self._get(self.base_url, {}, "/areaapi/v2.0.0/state/lookup", HEADERS)
         
         items = raw["response"]["result"]["package"]["item"]
 
@@ -71,30 +43,35 @@ class AttomClient:
 
         return pd.DataFrame(records)
 
-    def fetch_boundary(self, geoIdV4: str) -> pd.DataFrame:
+    # Boundary payloads carry multi-MB WKT, stream items one at a time 
+    def iter_boundary(self, geoIdV4: str):
 
         endpoint = "/areaapi/v2.0.0/boundary/detail"
-        raw      = self._get(endpoint, 
-                             {"geoIdV4": geoIdV4, 
-                              "format": "wkt"})
-
-        items = (raw["response"]["result"]["package"]["item"])
+        items    = self._stream(self.base_url, 
+                                {"geoIdV4": geoIdV4, 
+                                 "format": "wkt"},
+                                "response.result.package.item.item",
+                                endpoint, HEADERS)
 
-        # Get properties, record coordinate from geometry field and append 
-        records = []
+        # Get properties, record coordinate from geometry field 
         for item in items: 
-            records.append({
+            yield {
                 "geoIdV4":   item["geoIdV4"],
                 "name":      item["name"],
                 "bound_wkt": item["boundary"]
-            })
+            }
+
+    def fetch_boundary(self, geoIdV4: str) -> pd.DataFrame:
         # Return all props as dataframe
-        return pd.DataFrame(records)
+        return pd.DataFrame(list(self.iter_boundary(geoIdV4)))
 
     # SQLITE 
-    def save(self, df: pd.DataFrame, table: str):
-        df["fetched_at"] = datetime.now()
-        df.to_sql(table, con=self.engine, if_exists="append", index=False)
+    # Boundary tables are append-only and already hold datetime fetched_at rows
+    def _stamp(self):
+        return datetime.now()
+
+    def save(self, df: pd.DataFrame, table: str, wait: bool=True):
+        return self._save(df, table, if_exists="append", wait=wait)
 
     # WORKFLOW 
     def update_states(self):
@@ -102,9 +79,21 @@ class AttomClient:
         # For each requested geography get datasets and insert in db 
         states_df = self.fetch_states()
         for state_id, _, geoIdV4 in states_df[["code","name","geoIdV4"]].itertuples(index=False): 
-            boundary_df  = self.fetch_boundary(geoIdV4)
-            self.save(boundary_df, f"state_{state_id}_boundary")
-            print(f"State: {state_id} Done")
+            start = time.perf_counter()
+
+            # Parse the next item while the previous one is written, waiting on 
+            # each write before queueing another so at most two WKTs are held 
+            pending = None
+            for record in self.iter_boundary(geoIdV4): 
+                if pending is not None: 
+                    pending.result()
+                pending = self.save(pd.DataFrame([record]), f"state_{state_id}_boundary", wait=False)
+            if pending is not None: 
+                pending.result()
+
+            peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            logger.info("State: %s Done in %.2fs, peak RSS %.1f MB", 
+                        state_id, time.perf_counter() - start, peak_mb)
 
     # TEST API 
     def test_pull(self, state_code: str):
@@ -140,6 +129,7 @@ class AttomClient:
 
 # Simple call to scheduler 
 if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
     client = AttomClient()
 
     # Test API
@@ -147,6 +137,7 @@ if __name__ == "__main__":
     
     # Init scheduler 
     client.update_states()
+    client.export_metrics("data/attom_metrics.prom")
     client.schedule_geographies()
     print("Ctrl+C to exit API Scheduler.")
 
@@ -0,0 +1,251 @@
+import argparse, gzip, json, math, os, random, resource, shutil, sys, tempfile, threading
+import time as t
+import multiprocessing as mp
+import numpy as np, pandas as pd
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import clientbackbone as cb
+from db import STATES
+from attom import AttomClient
+from soil import SoilClient
+
+'''
+Offline benchmark of the ingestion pipeline against a local stub server.
+
+standard usage:
+python bench.py
+
+record a new baseline:
+python bench.py --save-baseline
+
+slow, rate-limited upstream:
+python bench.py --latency 50 --p429 0.05
+'''
+
+SOIL_FIELDS = ["clay","silt","sand","soc","phh2o","bdod"]
+SOIL_DEPTHS = [(0, 5), (5, 15), (15, 30), (30, 60), (60, 100), (100, 200), (0, 30)]
+
+# Higher is better for throughput, lower is better for memory. Every stage
+# total is also checked (lower is better) once it reaches MIN_STAGE_SECONDS
+CHECKS = {"requests_per_sec": 1, "rows_per_sec": 1, "peak_rss_mb": -1}
+MIN_STAGE_SECONDS = 0.05
+
+# FIXTURES
+def state_lookup(states: list[str]) -> dict:
+    items = [{"abbreviation": s, "name": s, "geoIdV4": f"geo{s}"} for s in states]
+    return {"response": {"result": {"package": {"item": items}}}}
+
+# Jittered circle around a per-state center, n vertices of WKT
+def boundary_detail(state: str, idx: int, n_vertices: int) -> dict:
+    rng    = random.Random(idx)
+    cx, cy = -120 + (idx % 10) * 5, 30 + (idx // 10) * 4
+    coords = []
+    for i in range(n_vertices):
+        a = 2 * math.pi * i / n_vertices
+        r = 1.5 + 0.05 * rng.random()
+        coords.append(f"{cx + r * math.cos(a):.8f} {cy + r * math.sin(a):.8f}")
+    coords.append(coords[0])
+    wkt  = f"MULTIPOLYGON ((({', '.join(coords)})))"
+    item = {"geoIdV4": f"geo{state}", "name": state, "boundary": wkt}
+    return {"response": {"result": {"package": {"item": [item]}}}}
+
+# Mirrors the SoilGrids v2.0 properties/query response layout
+def soil_point() -> dict:
+    layers = []
+    for name in SOIL_FIELDS:
+        depths = []
+        for top, bottom in SOIL_DEPTHS:
+            values = {s: random.randint(1, 500) for s in ["mean","Q0.05","Q0.5","Q0.95","uncertainty"]}
+            depths.append({"range": {"top_depth": top, "bottom_depth": bottom, "unit_depth": "cm"},
+                           "label": f"{top}-{bottom}cm", "values": values})
+        layers.append({"name": name, "unit_measure": {}, "depths": depths})
+    return {"type": "Feature", "geometry": None, "properties": {"layers": layers}}
+
+# STUB SERVER
+def serve(cfg: dict, port_q):
+    random.seed(cfg["seed"])
+    states   = STATES[:cfg["states"]]
+    lookup   = json.dumps(state_lookup(states)).encode()
+    boundary = {f"geo{s}": json.dumps(boundary_detail(s, i, cfg["vertices"])).encode()
+                for i, s in enumerate(states)}
+    soil     = json.dumps(soil_point()).encode()
+    lock     = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Buffer headers and body into one write, avoids Nagle/delayed-ACK stalls
+        wbufsize = 1 << 16
+
+        def do_GET(self):
+            t.sleep(cfg["latency"] / 1000)
+            with lock:
+                throttled = random.random() < cfg["p429"]
+            if throttled:
+                self.send_response(429)
+                self.send_header("Retry-After", str(cfg["retry_after"]))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                self.wfile.flush()
+                return
+
+            if "state/lookup" in self.path:
+                body = lookup
+            elif "boundary/detail" in self.path:
+                geo  = self.path.split("geoIdV4=")[1].split("&")[0]
+                body = boundary[geo]
+            else:
+                body = soil
+
+            gz = "gzip" in self.headers.get("Accept-Encoding", "")
+            if gz:
+                body = gzip.compress(body, 1)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if gz:
+                self.send_header("Content-Encoding", "gzip")
+            self.end_headers()
+            self.wfile.write(body)
+            self.wfile.flush()
+
+        def log_message(self, *args):
+            pass
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    port_q.put(srv.server_port)
+    srv.serve_forever()
+
+# HARNESS
+def run(cfg: dict) -> dict:
+    # Server lives in its own process so peak RSS only reflects the clients
+    port_q = mp.Queue()
+    server = mp.Process(target=serve, args=(cfg, port_q), daemon=True)
+    server.start()
+    base = f"http://127.0.0.1:{port_q.get(timeout=120)}"
+    tmp  = tempfile.mkdtemp(prefix="topo-bench-")
+
+    try:
+        random.seed(cfg["seed"])
+        attom = AttomClient(base, os.path.join(tmp, "attom.db"))
+        soil  = SoilClient(f"{base}/soilgrids/v2.0/properties/query",
+                           os.path.join(tmp, "soil.db"), os.path.join(tmp, "attom.db"))
+        save  = cb.ParentClient(os.path.join(tmp, "save.db"))
+        for client in (attom, soil):
+            client.rate_limit = cfg["rate_limit"]
+
+        timings = {}
+        start = t.perf_counter()
+        attom.update_states()
+        timings["attom"] = t.perf_counter() - start
+
+        start = t.perf_counter()
+        soil.get_states(STATES[:cfg["states"]])
+        timings["soil"] = t.perf_counter() - start
+
+        # Raw _save throughput on a wide frame shaped like state_soil_raw
+        cols = [f"c{i}" for i in range(cfg["save_cols"])]
+        df   = pd.DataFrame(np.random.default_rng(cfg["seed"]).random((cfg["save_rows"], len(cols))), columns=cols)
+        start = t.perf_counter()
+        save._save(df, "bench_save")
+        timings["save"] = t.perf_counter() - start
+    finally:
+        server.terminate()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    stages = {}
+    for client in (attom, soil, save):
+        for name, s in client.metrics.stages.items():
+            stages[name] = stages.get(name, 0.0) + s
+
+    summaries = [c.metrics.summary() for c in (attom, soil, save)]
+    requests  = sum(s["requests"] for s in summaries)
+    rows      = sum(s["rows"] for s in summaries)
+    fetch     = timings["attom"] + timings["soil"]
+    # Retried 429s are responses too, throughput only counts 2xx so more
+    # throttling can't read as a speedup
+    ok        = sum(n for c in (attom, soil, save)
+                    for (_, code), n in c.metrics.status.items() if 200 <= code < 300)
+    return {
+        "requests":         requests,
+        "ok_requests":      ok,
+        "rows":             rows,
+        "bytes":            sum(s["bytes"] for s in summaries),
+        "requests_per_sec": ok / fetch,
+        "rows_per_sec":     rows / stages["write"],
+        "peak_rss_mb":      resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "timings":          timings,
+        "stages":           stages
+    }
+
+def report(result: dict):
+    print(f"requests        {result['requests']:>10d}  ({result['ok_requests']} ok, {result['requests_per_sec']:.1f} ok/s)")
+    print(f"rows written    {result['rows']:>10d}  ({result['rows_per_sec']:.1f}/s of write time)")
+    print(f"bytes received  {result['bytes']:>10d}")
+    print(f"peak rss        {result['peak_rss_mb']:>10.1f} MB")
+    for name, s in result["timings"].items():
+        print(f"run   {name:<9} {s:>10.3f} s")
+    for name, s in sorted(result["stages"].items(), key=lambda kv: -kv[1]):
+        print(f"stage {name:<9} {s:>10.3f} s")
+
+# Returns failed checks, a check fails when it is worse than baseline by > tolerance
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    checks = [(key, result[key], baseline[key], sign) for key, sign in CHECKS.items()]
+    # Stages below the noise floor swing by large fractions and are skipped
+    for name, old in baseline.get("stages", {}).items():
+        if old >= MIN_STAGE_SECONDS:
+            checks.append((f"stage {name}", result["stages"].get(name, 0.0), old, -1))
+
+    failures = []
+    for key, new, old, sign in checks:
+        if old == 0:
+            continue
+        change = (new - old) / old * sign
+        if change < -tolerance:
+            failures.append(f"{key}: {old:.2f} -> {new:.2f} ({change:+.1%})")
+    return failures
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--states",      type=int,   default=10,    help="states served by the stub")
+    p.add_argument("--vertices",    type=int,   default=50000, help="WKT vertices per boundary")
+    p.add_argument("--latency",     type=float, default=0.0,   help="stub latency per request (ms)")
+    p.add_argument("--p429",        type=float, default=0.0,   help="probability of a 429 response")
+    p.add_argument("--retry-after", type=int,   default=0,     help="Retry-After sent with 429s")
+    p.add_argument("--rate-limit",  type=int,   default=10000, help="client calls per minute")
+    p.add_argument("--save-rows",   type=int,   default=50000, help="rows in the _save benchmark")
+    p.add_argument("--save-cols",   type=int,   default=200,   help="columns in the _save benchmark")
+    p.add_argument("--seed",        type=int,   default=0)
+    p.add_argument("--baseline",    default="data/bench_baseline.json")
+    p.add_argument("--tolerance",   type=float, default=0.2,   help="allowed fractional regression")
+    p.add_argument("--save-baseline", action="store_true", help="write this run as the baseline")
+
+    args = p.parse_args()
+    cfg  = {k: v for k, v in vars(args).items() if k not in ("baseline", "tolerance", "save_baseline")}
+
+    result = run(cfg)
+    report(result)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({**result, "config": cfg}, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("config") != cfg:
+        sys.exit(f"Baseline at {args.baseline} was recorded with a different config, "
+                 "rerun with matching options or --save-baseline")
+
+    failures = compare(result, baseline, args.tolerance)
+    if failures:
+        sys.exit("Regression against baseline:\n  " + "\n  ".join(failures))
+    print("No regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,166 @@
-import time as t 
+import time as t
+import logging
+from concurrent.futures import Future
 import requests
+import ijson
 import pandas as pd
-from sqlalchemy import create_engine  
+from urllib.parse import urlparse
 from apscheduler.schedulers.background import BackgroundScheduler
 
-class ParentClient: 
+import db
+from metrics import ClientMetrics
 
-    def __init__(self, db_path: str, rate_limit=200):
-        # Limit to 6 calls a min < 10k/day 
+logger = logging.getLogger(__name__)
+
+# File-like view of a raw response body, times socket reads (and gzip decoding)
+# and counts decoded bytes so streamed requests match _get's http/bytes metrics
+class TimedReader:
+
+    def __init__(self, raw):
+        self.raw     = raw
+        self.elapsed = 0.0
+        self.nbytes  = 0
+
+    def read(self, size=-1) -> bytes:
+        start = t.perf_counter()
+        chunk = self.raw.read(size)
+        self.elapsed += t.perf_counter() - start
+        self.nbytes  += len(chunk)
+        return chunk
+
+class ParentClient:
+
+    def __init__(self, db_path: str, rate_limit=200, max_retries=3):
+        # Limit to 6 calls a min < 10k/day
         self.rate_limit  = rate_limit
         self.calls_made  = 0
-        self.client_time = t.time() 
-        self.engine      = create_engine(f"sqlite:///{db_path}")
+        self.max_retries = max_retries
+        self.client_time = t.time()
+        self.writer      = db.writer(db_path)
         self.scheduler   = BackgroundScheduler(timezone="America/Chicago")
         self.session     = requests.Session()
+        self.metrics     = ClientMetrics(type(self).__name__)
 
 
-    def _throttle(self):
+    def _throttle(self, endpoint: str=""):
         current = t.time()
-        elapsed = current - self.client_time 
-        print(f"{elapsed}...")
+        elapsed = current - self.client_time
+        logger.debug("throttle window %.2fs, %d calls", elapsed, self.calls_made)
 
         # Rate and time checks
-        if elapsed >= 60: 
-            self.client_time = t.time() 
-            self.calls_made  = 0 
-        elif self.calls_made >= self.rate_limit: 
-            wait = 60 - elapsed  
+        if elapsed >= 60:
+            self.client_time = t.time()
+            self.calls_made  = 0
+        elif self.calls_made >= self.rate_limit:
+            wait = 60 - elapsed
+            logger.info("rate limit reached, sleeping %.2fs", wait)
             t.sleep(wait)
+            self.metrics.observe_throttle(endpoint, wait)
             self.client_time = t.time()
-            self.calls_made  = 0 
+            self.calls_made  = 0
 
         self.calls_made += 1
 
+    # Throttled GET, backs off and retries on 429 honoring Retry-After
+    def _request(self, url: str, label: str, params: dict, headers: dict, timeout: int, stream=False):
+        for attempt in range(self.max_retries + 1):
+            self._throttle(label)
+            start   = t.perf_counter()
+            resp    = self.session.get(url, headers=headers, params=params,
+                                       timeout=timeout, stream=stream)
+            elapsed = t.perf_counter() - start
+            logger.debug("GET %s: %d in %.3fs", resp.url, resp.status_code, elapsed)
+            if resp.status_code != 429 or attempt == self.max_retries:
+                return resp, elapsed
+
+            self.metrics.observe_request(label, elapsed, resp.status_code, len(resp.content))
+            try:
+                wait = float(resp.headers.get("Retry-After", 2 ** attempt))
+            except ValueError:
+                wait = 2 ** attempt
+            logger.info("429 from %s, retrying in %.1fs", label, wait)
+            resp.close()
+            t.sleep(wait)
+            self.metrics.observe_throttle(label, wait)
+
     def _get(self, base_url: str, params: dict, endpoint: str="", headers: dict={}) -> dict:
-        self._throttle()
-        url = f"{base_url}{endpoint}"
-        print(f"url: {url}")
-        if headers == {} and endpoint == "":
-            resp = self.session.get(url, params=params, timeout=30)
-        else: 
-            resp = self.session.get(url, headers=headers, params=params, timeout=180)
-        print(f"GET {resp.url}: {resp.status_code}")
+        url     = f"{base_url}{endpoint}"
+        label   = endpoint or urlparse(url).path
+        timeout = 30 if headers == {} and endpoint == "" else 180
+
+        resp, elapsed = self._request(url, label, params, headers, timeout)
+        self.metrics.observe_request(label, elapsed, resp.status_code, len(resp.content))
 
         resp.raise_for_status()
-        return resp.json()
+        start = t.perf_counter()
+        data  = resp.json()
+        self.metrics.observe_json(label, t.perf_counter() - start)
+        return data
+
+    # Incrementally parses items under an ijson prefix ("a.b.item" for each element
+    # of the array at a.b) so large payloads are never held in memory as a whole
+    def _stream(self, base_url: str, params: dict, prefix: str, endpoint: str="", headers: dict={}):
+        url   = f"{base_url}{endpoint}"
+        label = endpoint or urlparse(url).path
+
+        resp, elapsed = self._request(url, label, params, headers, 180, stream=True)
+        with resp:
+            if not resp.ok:
+                self.metrics.observe_request(label, elapsed, resp.status_code, len(resp.content))
+                resp.raise_for_status()
+
+            # Let urllib3 undo gzip/deflate before the parser sees the body, 1MB reads
+            # keep per-chunk decompression overhead from dominating on large WKT
+            resp.raw.decode_content = True
+            body   = TimedReader(resp.raw)
+            items  = ijson.items(body, prefix, use_float=True, buf_size=1 << 20)
+            decode = 0.0
+            while True:
+                start = t.perf_counter()
+                item  = next(items, StopIteration)
+                decode += t.perf_counter() - start
+                if item is StopIteration:
+                    break
+                yield item
+
+            # Body reads count as http like in _get, the remainder is parsing
+            self.metrics.observe_request(label, elapsed + body.elapsed, resp.status_code, body.nbytes)
+            self.metrics.observe_json(label, decode - body.elapsed)
+
+
+    # Queued on the shared writer thread, wait=False returns the Future so
+    # callers can keep parsing while writes are batched
+    def _save(self, df: pd.DataFrame, table: str, if_exists: str="replace", wait: bool=True):
+        df["fetched_at"] = self._stamp()
+
+        def write(con):
+            start = t.perf_counter()
+            df.to_sql(table, con=con, if_exists=if_exists, index=False)
+            return t.perf_counter() - start
+
+        # Metrics are recorded once the write commits, so a batch that rolls
+        # back and is retried only counts the attempt that stuck. The returned
+        # future resolves after that, callers never see a write without metrics
+        done = Future()
+
+        def record(future):
+            if future.exception() is not None:
+                done.set_exception(future.exception())
+                return
+            self.metrics.observe_write(table, future.result(), len(df))
+            done.set_result(None)
+
+        self.writer.submit(write).add_done_callback(record)
+        return done.result() if wait else done
 
+    # Value written to fetched_at, subclasses override to keep their table's type
+    def _stamp(self):
+        return t.time()
 
-    def _save(self, df: pd.DataFrame, table: str):
-        df["fetched_at"] = t.time()
-        df.to_sql(table, con=self.engine, if_exists="replace", index=False)
+    # Dump collected metrics, .prom for Prometheus textfile otherwise sqlite table
+    def export_metrics(self, path: str, table: str="client_metrics"):
+        if path.endswith(".prom"):
+            self.metrics.to_prometheus(path)
+        else:
+            db.writer(path).submit(lambda con: self.metrics.to_sql(con, table)).result()
+        logger.info("metrics exported to %s: %s", path, self.metrics.summary())
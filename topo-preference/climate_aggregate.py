@@ -1,7 +1,7 @@
-import sqlite3, pandas as pd 
+import db
 
-with sqlite3.connect("data/noaa.db") as dat: 
-    df = pd.read_sql(f"SELECT * FROM state_climate_raw", dat)
+path = db.NOAA_DB
+df   = db.read_frame(path, "SELECT * FROM state_climate_raw")
 
 norm_cols = [f"norm_{i}" for i in range(36)]
 norm = df[norm_cols].to_numpy(float).reshape(-1, 12, 3)
@@ -10,15 +10,7 @@ norm = df[norm_cols].to_numpy(float).reshape(-1, 12, 3)
 mean_temp = norm[:, :, 0]
 
 # Do each month individually 
-states = [
-    "AL","AK","AZ","AR","CA","CO","CT","DE","FL","GA",
-    "HI","ID","IL","IN","IA","KS","KY","LA","ME","MD",
-    "MA","MI","MN","MS","MO","MT","NE","NV","NH","NJ",
-    "NM","NY","NC","ND","OH","OK","OR","PA","RI","SC",
-    "SD","TN","TX","UT","VT","VA","WA","WV","WI","WY"
-]
-
-for state in states:
+for state in db.STATES:
 
     st_mask = df["state"] == state
     st_norm = df.loc[st_mask, norm_cols].to_numpy(float).reshape(1, 12, 3)
@@ -41,6 +33,6 @@ df["annual_prcp"] = annual_prcp
 df["temp_range"]  = temp_range 
 
 cols = list(df.columns)
-path = "data/noaa.db"
-with sqlite3.connect(path) as dat: 
-    df.to_sql("state_climate", dat, if_exists="replace", index=False)
+db.writer(path).submit(
+    lambda con: df.to_sql("state_climate", con, if_exists="replace", index=False)
+).result()
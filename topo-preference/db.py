@@ -0,0 +1,138 @@
+import os, queue, logging, threading
+import numpy as np, pandas as pd
+from concurrent.futures import Future
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Shared database files, written by the clients and read by the offline steps
+ATTOM_DB = "data/attom_data.db"
+SOIL_DB  = "data/soil.db"
+NOAA_DB  = "data/noaa.db"
+
+# Row order of every per-state table and of the feature store
+STATES = [
+    "AL","AK","AZ","AR","CA","CO","CT","DE","FL","GA",
+    "HI","ID","IL","IN","IA","KS","KY","LA","ME","MD",
+    "MA","MI","MN","MS","MO","MT","NE","NV","NH","NJ",
+    "NM","NY","NC","ND","OH","OK","OR","PA","RI","SC",
+    "SD","TN","TX","UT","VT","VA","WA","WV","WI","WY"
+]
+
+# Applied to every new connection. WAL lets readers run alongside the writer,
+# NORMAL sync is safe under WAL and skips an fsync per commit
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous":  "NORMAL",
+    "busy_timeout": 30000,      # ms
+    "temp_store":   "MEMORY"
+}
+
+# Read connections only. The writer appends pages it never reads back, a large
+# cache there just holds every written row in RSS
+READ_PRAGMAS = {
+    "cache_size":   -65536,     # KiB, 64MB page cache
+    "mmap_size":    268435456   # 256MB
+}
+
+_engines: dict[tuple[str, bool], Engine] = {}
+_writers: dict[str, "Writer"] = {}
+_lock = threading.RLock()
+
+# One pooled engine per database file for the whole process, plus a separate
+# one for the writer thread. Writer transactions open with BEGIN IMMEDIATE so
+# the write lock is taken (or waited on through busy_timeout) up front, a
+# deferred BEGIN upgrading from read to write fails with "database is locked"
+# straight away when another process holds the lock
+def engine(path: str, writer: bool=False) -> Engine:
+    key = (os.path.abspath(path), writer)
+    with _lock:
+        if key not in _engines:
+            eng     = create_engine(f"sqlite:///{key[0]}",
+                                    connect_args={"check_same_thread": False, "timeout": 30})
+            pragmas = PRAGMAS if writer else {**PRAGMAS, **READ_PRAGMAS}
+            begin   = "BEGIN IMMEDIATE" if writer else "BEGIN"
+
+            @event.listens_for(eng, "connect")
+            def _connect(dbapi_con, _):
+                # Take transaction control from pysqlite so BEGIN covers DDL too
+                dbapi_con.isolation_level = None
+                cur = dbapi_con.cursor()
+                for name, value in pragmas.items():
+                    cur.execute(f"PRAGMA {name}={value}")
+                cur.close()
+
+            @event.listens_for(eng, "begin")
+            def _begin(con):
+                con.exec_driver_sql(begin)
+
+            _engines[key] = eng
+        return _engines[key]
+
+# Single writer thread per database file, queued jobs are drained and
+# committed together in one transaction. submit() blocks once maxsize jobs
+# are pending so producers can't outrun SQLite
+class Writer:
+
+    def __init__(self, path: str, batch: int=64, maxsize: int=256):
+        self.path   = path
+        self.batch  = batch
+        self.engine = engine(path, writer=True)
+        self.jobs  = queue.Queue(maxsize=maxsize)
+        self.thread = threading.Thread(target=self._run, name=f"sqlite-writer:{path}", daemon=True)
+        self.thread.start()
+
+    # fn receives an open Connection, e.g. lambda con: df.to_sql(table, con)
+    def submit(self, fn) -> Future:
+        future = Future()
+        self.jobs.put((fn, future))
+        return future
+
+    def _run(self):
+        while True:
+            jobs = [self.jobs.get()]
+            while len(jobs) < self.batch:
+                try:
+                    jobs.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                with self.engine.begin() as con:
+                    results = [fn(con) for fn, _ in jobs]
+            except Exception:
+                # Batch rolled back, rerun one at a time so only the bad job fails
+                logger.warning("batch of %d writes to %s failed, retrying individually",
+                               len(jobs), self.path)
+                for fn, future in jobs:
+                    try:
+                        with self.engine.begin() as con:
+                            result = fn(con)
+                    except Exception as e:
+                        future.set_exception(e)
+                    else:
+                        future.set_result(result)
+                continue
+
+            for (_, future), result in zip(jobs, results):
+                future.set_result(result)
+
+def writer(path: str) -> Writer:
+    key = os.path.abspath(path)
+    with _lock:
+        if key not in _writers:
+            _writers[key] = Writer(key)
+        return _writers[key]
+
+# BULK READS, params use sqlite qmark style: read_frame(db, "... WHERE state = ?", ("CA",))
+def read_frame(path: str, sql: str, params: tuple=()) -> pd.DataFrame:
+    with engine(path).connect() as con:
+        return pd.read_sql(sql, con, params=params)
+
+def read_arrays(path: str, sql: str, params: tuple=()) -> dict[str, np.ndarray]:
+    df = read_frame(path, sql, params)
+    return {col: df[col].to_numpy() for col in df.columns}
+
+def tables(path: str) -> set[str]:
+    return set(read_frame(path, "SELECT name FROM sqlite_master WHERE type='table'")["name"])
@@ -0,0 +1,163 @@
+import os, json, hashlib, logging
+import numpy as np, pandas as pd
+import geopandas as gpd
+from shapely.ops import unary_union
+
+import db
+from db import STATES
+
+logger = logging.getLogger(__name__)
+
+CLIMATE_COLS = [f"mean_temp_{m:02d}" for m in range(12)] + ["annual_prcp", "temp_range"]
+GEOM_COLS    = ["geom_area_km2", "geom_centroid_lon", "geom_centroid_lat",
+                "geom_min_lon", "geom_min_lat", "geom_max_lon", "geom_max_lat"]
+
+# Bump when a block's layout changes so cached blocks are rebuilt
+FORMAT_VERSION = 1
+
+# Builds a per-state feature matrix stored as .npy blocks plus a json schema.
+# Each block is tied to one source db and only rebuilt when that db changes.
+class FeatureStore:
+
+    def __init__(self, root="data/features", noaa=db.NOAA_DB,
+                 soil=db.SOIL_DB, attom=db.ATTOM_DB, n_pcs=3):
+        self.root     = root
+        self.n_pcs    = n_pcs
+        self.sources  = {"climate": noaa, "soil": soil, "geometry": attom}
+        self.params   = {"climate": {"n_pcs": n_pcs}, "soil": {}, "geometry": {}}
+        self.builders = {
+            "climate":  self.climate_block,
+            "soil":     self.soil_block,
+            "geometry": self.geometry_block
+        }
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    # Cheap change detection from file size and mtime, WAL file included once
+    # it holds frames. The db is opened first so a one-off switch to WAL mode
+    # lands before the stat rather than after the build. Builder parameters
+    # and the block format are hashed in too
+    def fingerprint(self, source: str) -> str:
+        if os.path.exists(self.sources[source]):
+            db.tables(self.sources[source])
+
+        h = hashlib.sha1(json.dumps([FORMAT_VERSION, self.params[source]]).encode())
+        for path in (self.sources[source], self.sources[source] + "-wal"):
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                st = os.stat(path)
+                h.update(f"{path}:{st.st_size}:{st.st_mtime_ns}".encode())
+        return h.hexdigest()
+
+    def schema(self) -> dict:
+        path = self._path("schema.json")
+        if not os.path.exists(path):
+            return {"blocks": {}}
+        with open(path) as f:
+            return json.load(f)
+
+    # Climate aggregates and their leading principal components
+    def climate_block(self) -> pd.DataFrame:
+        df = db.read_frame(self.sources["climate"], "SELECT * FROM state_climate")
+
+        X  = df[CLIMATE_COLS].to_numpy(float)
+        Z  = (X - X.mean(axis=0)) / np.where(X.std(axis=0) > 0, X.std(axis=0), 1.0)
+        _, _, vt = np.linalg.svd(Z, full_matrices=False)
+        pcs = Z @ vt[:self.n_pcs].T
+
+        out = pd.DataFrame(X, columns=CLIMATE_COLS, index=df["state"])
+        for i in range(pcs.shape[1]):
+            out[f"climate_pc_{i}"] = pcs[:, i]
+        return out
+
+    # Mean and spread of each soil property over the sampled points
+    def soil_block(self) -> pd.DataFrame:
+        df = db.read_frame(self.sources["soil"], "SELECT * FROM state_soil_raw")
+
+        df  = df.drop(columns=["lat", "lon", "fetched_at"], errors="ignore")
+        agg = df.groupby("state").agg(["mean", "std"])
+        agg.columns = [f"soil_{col}_{stat}" for col, stat in agg.columns]
+        return agg
+
+    # Area (km^2, equal-area projection), centroid and bounding box per state
+    def geometry_block(self) -> pd.DataFrame:
+        records = []
+        path    = self.sources["geometry"]
+        tables  = db.tables(path)
+        for state in STATES:
+            table = f"state_{state}_boundary"
+            if table not in tables:
+                continue
+            wkt  = db.read_arrays(path, f"SELECT bound_wkt FROM {table} WHERE bound_wkt IS NOT NULL")["bound_wkt"]
+            geom = unary_union(gpd.GeoSeries.from_wkt(wkt).tolist())
+            minx, miny, maxx, maxy = geom.bounds
+            area = gpd.GeoSeries([geom], crs="EPSG:4326").to_crs("EPSG:5070").area.iloc[0]
+            records.append((state, area / 1e6, geom.centroid.x, geom.centroid.y,
+                            minx, miny, maxx, maxy))
+        # No boundary tables still yields the columns, reindex fills NaN
+        return pd.DataFrame.from_records(records, columns=["state"] + GEOM_COLS).set_index("state")
+
+    def _write(self, name: str, arr: np.ndarray):
+        tmp = self._path(f".{name}.tmp.npy")
+        np.save(tmp, np.ascontiguousarray(arr))
+        os.replace(tmp, self._path(f"{name}.npy"))
+
+    # Rebuild stale blocks and the combined matrix, returns the schema
+    def build(self, force: bool=False) -> dict:
+        # Checked up front, reading a missing file would create an empty db
+        missing = [f"{name}: {path}" for name, path in self.sources.items() if not os.path.exists(path)]
+        if missing:
+            raise FileNotFoundError(f"Missing feature sources ({', '.join(missing)})")
+
+        os.makedirs(self.root, exist_ok=True)
+        schema  = self.schema()
+        blocks  = {}
+        stale   = force or schema.get("states") != STATES
+        changed = stale
+
+        for name, build in self.builders.items():
+            fp  = self.fingerprint(name)
+            old = schema["blocks"].get(name)
+            if not stale and old and old["fingerprint"] == fp and os.path.exists(self._path(f"{name}.npy")):
+                blocks[name] = old
+                continue
+
+            logger.info("Rebuilding %s features...", name)
+            df = build().reindex(STATES)
+            self._write(name, df.to_numpy(np.float64))
+            blocks[name] = {"fingerprint": fp, "columns": list(df.columns)}
+            changed = True
+
+        if not changed and os.path.exists(self._path("features.npy")):
+            logger.info("Feature store up to date: %s", schema["version"])
+            return schema
+
+        matrix  = np.hstack([np.load(self._path(f"{name}.npy")) for name in blocks])
+        columns = [c for name in blocks for c in blocks[name]["columns"]]
+        version = hashlib.sha1(json.dumps(
+            [[name, b["fingerprint"], b["columns"]] for name, b in blocks.items()]
+        ).encode()).hexdigest()[:12]
+
+        self._write("features", matrix)
+        schema = {"version": version, "states": STATES, "columns": columns,
+                  "dtype": "float64", "blocks": blocks}
+        tmp = self._path(".schema.tmp.json")
+        with open(tmp, "w") as f:
+            json.dump(schema, f, indent=2)
+        os.replace(tmp, self._path("schema.json"))
+        logger.info("Feature store built: %s (%d x %d)", version, *matrix.shape)
+        return schema
+
+    # Memory-mapped, read-only view of the matrix (or one block), no copy made
+    def load(self, block: str="features") -> tuple[np.ndarray, list[str], list[str]]:
+        schema  = self.schema()
+        if "columns" not in schema:
+            raise FileNotFoundError(f"No feature store at {self.root}, run build() first")
+        columns = schema["columns"] if block == "features" else schema["blocks"][block]["columns"]
+        arr     = np.load(self._path(f"{block}.npy"), mmap_mode="r")
+        return arr, columns, schema["states"]
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    store = FeatureStore()
+    store.build()
@@ -0,0 +1,156 @@
+import time as t
+import threading
+import pandas as pd
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Upper bounds (seconds) for request latency histogram
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 180.0)
+
+class Histogram:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts  = [0] * len(buckets)
+        self.total   = 0.0
+        self.count   = 0
+
+    def observe(self, value: float):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+# Collects per endpoint/table timings for a single client. Writes are
+# recorded from the db writer thread, so all access goes through the lock
+class ClientMetrics:
+
+    def __init__(self, client: str):
+        self.client   = client
+        self.lock     = threading.Lock()
+        self.latency  = defaultdict(Histogram)   # endpoint -> Histogram
+        self.status   = defaultdict(int)         # (endpoint, code) -> count
+        self.bytes    = defaultdict(int)         # endpoint -> bytes received
+        self.json     = defaultdict(float)       # endpoint -> decode seconds
+        self.throttle = defaultdict(float)       # endpoint -> seconds blocked
+        self.write    = defaultdict(float)       # table -> to_sql seconds
+        self.rows     = defaultdict(int)         # table -> rows written
+        self.stages   = defaultdict(float)       # stage -> seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        start = t.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.stages[name] += t.perf_counter() - start
+
+    def observe_request(self, endpoint: str, elapsed: float, code: int, nbytes: int):
+        with self.lock:
+            self.latency[endpoint].observe(elapsed)
+            self.status[(endpoint, code)] += 1
+            self.bytes[endpoint]  += nbytes
+            self.stages["http"]   += elapsed
+
+    def observe_json(self, endpoint: str, elapsed: float):
+        with self.lock:
+            self.json[endpoint] += elapsed
+            self.stages["json"] += elapsed
+
+    def observe_throttle(self, endpoint: str, elapsed: float):
+        with self.lock:
+            self.throttle[endpoint] += elapsed
+            self.stages["throttle"] += elapsed
+
+    def observe_write(self, table: str, elapsed: float, rows: int):
+        with self.lock:
+            self.write[table]    += elapsed
+            self.rows[table]     += rows
+            self.stages["write"] += elapsed
+
+    # Where did the run spend its time: network, rate limiter or writes
+    def summary(self) -> dict:
+        with self.lock:
+            return {
+                "requests": sum(h.count for h in self.latency.values()),
+                "bytes":    sum(self.bytes.values()),
+                "rows":     sum(self.rows.values()),
+                "stages":   dict(self.stages),
+                "bound":    max(self.stages, key=self.stages.get) if self.stages else None
+            }
+
+    def records(self) -> list[dict]:
+        records = []
+
+        def add(metric, value, endpoint="", label=""):
+            records.append({"client": self.client, "metric": metric,
+                            "endpoint": endpoint, "label": label, "value": value})
+
+        with self.lock:
+            for endpoint, hist in self.latency.items():
+                for bound, count in zip(hist.buckets, hist.counts):
+                    add("request_seconds_bucket", count, endpoint, str(bound))
+                add("request_seconds_bucket", hist.count, endpoint, "+Inf")
+                add("request_seconds_sum",    hist.total, endpoint)
+                add("request_seconds_count",  hist.count, endpoint)
+            for (endpoint, code), count in self.status.items():
+                add("responses_total", count, endpoint, str(code))
+            for endpoint, n in self.bytes.items():
+                add("response_bytes_total", n, endpoint)
+            for endpoint, s in self.json.items():
+                add("json_decode_seconds_total", s, endpoint)
+            for endpoint, s in self.throttle.items():
+                add("throttle_seconds_total", s, endpoint)
+            for table, s in self.write.items():
+                add("write_seconds_total", s, label=table)
+            for table, n in self.rows.items():
+                add("rows_written_total", n, label=table)
+            for stage, s in self.stages.items():
+                add("stage_seconds_total", s, label=stage)
+        return records
+
+    # Prometheus text exposition format, readable by node_exporter textfile collector
+    def to_prometheus(self, path: str):
+        label_key = {
+            "request_seconds_bucket": "le",
+            "responses_total":        "code",
+            "write_seconds_total":    "table",
+            "rows_written_total":     "table",
+            "stage_seconds_total":    "stage"
+        }
+        types = {
+            "request_seconds": "histogram",
+            "responses_total": "counter",
+            "response_bytes_total": "counter",
+            "json_decode_seconds_total": "counter",
+            "throttle_seconds_total": "counter",
+            "write_seconds_total": "counter",
+            "rows_written_total": "counter",
+            "stage_seconds_total": "counter"
+        }
+
+        lines, typed = [], set()
+        for r in self.records():
+            family = r["metric"]
+            if family.startswith("request_seconds"):
+                family = "request_seconds"
+            if family not in typed:
+                lines.append(f"# TYPE client_{family} {types[family]}")
+                typed.add(family)
+
+            labels = [f'client="{self.client}"']
+            if r["endpoint"]:
+                labels.append(f'endpoint="{r["endpoint"]}"')
+            if r["label"]:
+                labels.append(f'{label_key[r["metric"]]}="{r["label"]}"')
+            lines.append(f'client_{r["metric"]}{{{",".join(labels)}}} {r["value"]}')
+
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def to_sql(self, con, table: str = "client_metrics"):
+        df = pd.DataFrame(self.records())
+        df["recorded_at"] = t.time()
+        df.to_sql(table, con=con, if_exists="append", index=False)
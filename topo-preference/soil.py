@@ -1,26 +1,28 @@
+import os, logging
 from typing import Dict, Optional
 import pandas as pd, numpy as np
 import clientbackbone as cb
+import db
 
 # Imports for state polygons 
 import geopandas as gpd, random  
 from shapely.ops import unary_union 
 from shapely.geometry import Point
-import sqlite3
+
+logger = logging.getLogger(__name__)
 
 class SoilClient(cb.ParentClient):
 
-    def __init__(self, url: str):
-        super().__init__("data/soil.db", 4)
-        self.url     = url.rstrip("/")
-        self.fields  = ["clay","silt","sand","soc","phh2o","bdod"]
-        self.divisor = {"phh2o": 10, "soc": 10, "bdod": 10}
+    def __init__(self, url: str, db_path=db.SOIL_DB, attom_path=db.ATTOM_DB):
+        super().__init__(db_path, 4)
+        self.url        = url.rstrip("/")
+        self.attom_path = attom_path
+        self.fields     = ["clay","silt","sand","soc","phh2o","bdod"]
+        self.divisor    = {"phh2o": 10, "soc": 10, "bdod": 10}
     
     # Pulls wkt bondary data from attom api data
-    def load_state_geometry(self, state: str, path="data/attom.db") -> gpd.GeoDataFrame:
-        attom = sqlite3.connect(path)
-        df    = pd.read_sql(f"SELECT name, bound_wkt FROM state_{state}_boundary", attom)
-        attom.close()
+    def load_state_geometry(self, state: str, path=None) -> gpd.GeoDataFrame:
+        df = db.read_frame(path or self.attom_path, f"SELECT name, bound_wkt FROM state_{state}_boundary")
 
         # Gets geometry from wkt file 
         df["geometry"] = df["bound_wkt"].apply(
@@ -84,12 +86,13 @@ class SoilClient(cb.ParentClient):
         return result 
 
     def fetch_for_state(self, state: str):
-        state_gdf = self.load_state_geometry(state)
-        if state_gdf.empty:
-            raise ValueError(f"No boundary for {state}...")
-    
-        geometry = unary_union(state_gdf.geometry)
-        points = self.sample_grid(geometry)
+        with self.metrics.stage("geometry"):
+            state_gdf = self.load_state_geometry(state)
+            if state_gdf.empty:
+                raise ValueError(f"No boundary for {state}...")
+        
+            geometry = unary_union(state_gdf.geometry)
+            points = self.sample_grid(geometry)
         records = []
         for point in points: 
             lat, lon = point.y, point.x 
@@ -98,7 +101,8 @@ class SoilClient(cb.ParentClient):
                 raise ValueError(f"No data for {state}...")
 
             record = {"lat": lat, "lon": lon, "state": state}
-            record.update(self.flatten(data))
+            with self.metrics.stage("flatten"):
+                record.update(self.flatten(data))
             records.append(record)
 
         return pd.DataFrame.from_records(records)
@@ -107,21 +111,15 @@ class SoilClient(cb.ParentClient):
 
         all_dfs = []
         for state in states:
-            print(f"Fetching {state}...")
+            logger.info("Fetching %s...", state)
             all_dfs.append(self.fetch_for_state(state))
 
         df_final = pd.concat(all_dfs, ignore_index=True)
         self._save(df_final, "state_soil_raw")
 
 if __name__ == "__main__":
-    states = [
-        "AL","AK","AZ","AR","CA","CO","CT","DE","FL","GA",
-        "HI","ID","IL","IN","IA","KS","KY","LA","ME","MD",
-        "MA","MI","MN","MS","MO","MT","NE","NV","NH","NJ",
-        "NM","NY","NC","ND","OH","OK","OR","PA","RI","SC",
-        "SD","TN","TX","UT","VT","VA","WA","WV","WI","WY"
-    ]
-
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
     base_url = "https://rest.isric.org/soilgrids/v2.0/properties/query" 
     client   = SoilClient(base_url)
-    client.get_states(states)
+    client.get_states(db.STATES)
+    client.export_metrics("data/soil_metrics.prom")
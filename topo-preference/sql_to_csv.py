@@ -1,6 +1,8 @@
-import argparse, sqlite3, sys, pandas as pd 
+import argparse, sys
 from pathlib import Path 
 
+import db
+
 '''
 standard usage: 
 python sql_to_csv.py --db data/{client}.db --table {table_name}
@@ -34,8 +36,7 @@ def main():
         out_file = f"{base}-{name}.csv"
 
     try: 
-        with sqlite3.connect(args.db) as dat: 
-            df = pd.read_sql(sql_prompt, dat)
+        df = db.read_frame(args.db, sql_prompt)
     except Exception as e: 
         sys.exit(f"SQL Error:{e}")
 